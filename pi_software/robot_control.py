@@ -17,6 +17,11 @@
 # * Coding Convention PEP-8   https://www.python.org/dev/peps/pep-0008/
 # * Docstrings PEP-257   https://www.python.org/dev/peps/pep-0257/
 
+import logging
+import logging.handlers
+import os
+import queue
+import select
 import serial
 import time
 from sys import platform
@@ -24,6 +29,7 @@ from robot_libs.Raspberry_Pi_Lib import is_raspberry_pi
 #from collections import deque
 #import datetime
 
+log = logging.getLogger("robot_control")
 
 ################################################################
 # 
@@ -34,50 +40,45 @@ from robot_libs.Raspberry_Pi_Lib import is_raspberry_pi
 # For Raspberry Pi this shoudl work 'out-of-the-box', but for other platforms
 # you'll need to adjust the serial report depending on where the Nano got 
 # attached...
-if platform == "linux" or platform == "linux2":
-    if is_raspberry_pi():
-        # Raspberry Pi Serial Port
-        #
-        # See this for full details:
-        # 
-        # https://www.raspberrypi.org/documentation/configuration/uart.md
-        # 
-        # On the Raspberry Pi, one UART is selected to be present on GPIO 14 (transmit) 
-        # and 15 (receive) - this is the primary UART. By default, this will also be the 
-        # UART on which a Linux console may be present. Note that GPIO 14 is pin 8 on the 
-        # GPIO header, while GPIO 15 is pin 10.
-        # 
-        # 
-        # Model                 first PL011 (UART0)     mini UART
-        # Raspberry Pi Zero     primary                 secondary
-        # Raspberry Pi Zero W  secondary (Bluetooth)     primary
-        # 
-        # Linux device     Description
-        # /dev/ttyS0       mini UART
-        # /dev/ttyAMA0     first PL011 (UART0)
-        # /dev/serial0     primary UART
-        # /dev/serial1     secondary UART
-        # 
-        # Note: /dev/serial0 and /dev/serial1 are symbolic links which point to either 
-        # /dev/ttyS0 or /dev/ttyAMA0.        
-        
-        serial_port = "/dev/serial0"      # primary UART om pins 8 & 10 (GPIO14/15)
-
-    else:
-        # Desktop Linux Machine
-        serial_port = "/dev/ttyS1"
-        serial_port = "/dev/ttyUSB0"
-
-elif platform == "darwin":
-    # OS X - Mac Serial port
-    serial_port = "/dev/cu.usbserial-1420"
-    
-elif platform == "win32":
-    # Windows...
-    serial_port = "COM3"        # select your Windows serial port here
-    
+#
+# Raspberry Pi Serial Port
+#
+# See this for full details:
+# 
+# https://www.raspberrypi.org/documentation/configuration/uart.md
+# 
+# On the Raspberry Pi, one UART is selected to be present on GPIO 14 (transmit) 
+# and 15 (receive) - this is the primary UART. By default, this will also be the 
+# UART on which a Linux console may be present. Note that GPIO 14 is pin 8 on the 
+# GPIO header, while GPIO 15 is pin 10.
+# 
+# 
+# Model                 first PL011 (UART0)     mini UART
+# Raspberry Pi Zero     primary                 secondary
+# Raspberry Pi Zero W  secondary (Bluetooth)     primary
+# 
+# Linux device     Description
+# /dev/ttyS0       mini UART
+# /dev/ttyAMA0     first PL011 (UART0)
+# /dev/serial0     primary UART
+# /dev/serial1     secondary UART
+# 
+# Note: /dev/serial0 and /dev/serial1 are symbolic links which point to either 
+# /dev/ttyS0 or /dev/ttyAMA0.        
+RASPBERRY_PI_SERIAL_PORT = "/dev/serial0"      # primary UART om pins 8 & 10 (GPIO14/15)
+DESKTOP_LINUX_SERIAL_PORT = "/dev/ttyUSB0"     # or maybe "/dev/ttyS1"
+
+_SERIAL_PORT_BY_PLATFORM = {
+    "darwin": "/dev/cu.usbserial-1420",     # OS X - Mac Serial port
+    "win32": "COM3",                        # select your Windows serial port here
+}
+
+if platform.startswith("linux"):
+    serial_port = RASPBERRY_PI_SERIAL_PORT if is_raspberry_pi() else DESKTOP_LINUX_SERIAL_PORT
+elif platform in _SERIAL_PORT_BY_PLATFORM:
+    serial_port = _SERIAL_PORT_BY_PLATFORM[platform]
 else:
-    raise ValueError("Unknown platform")
+    raise ValueError("Unknown platform %r" % platform)
 
 
 ################################################################
@@ -92,50 +93,54 @@ BATTERY_VOLTAGE_TO_SHUTDOWN = 7.0   # volts
 MINIMUM_UKMARSEY_ARDUINO_NANO_SOFTWARE_VERSION = 1.2
 NEWLINE = b"\x0A"    # could be "\n" ... but we know only one byte is required
 UKMARSEY_CLI_ENCODING = 'utf8'
-
-################################################################
-# 
-# Globals
-# 
-
-numeric_error_codes = False
-echo_on = True
+REPLY_TIMEOUT = 0.1     # seconds to wait for a reply line
 
 ################################################################
 # 
 # List of Commands
 # 
-RESET_STATE_COMMAND = b"^" + NEWLINE
-SHOW_VERSION_COMMAND = b"v" + NEWLINE
-VERBOSE_OFF_COMMAND = b"V0" + NEWLINE
-VERBOSE_ON_COMMAND = b"V1" + NEWLINE
-ECHO_OFF_COMMAND = b"E0" + NEWLINE
-ECHO_ON_COMMAND = b"E1" + NEWLINE
-OK_COMMAND = b"?" + NEWLINE
-HELP_COMMAND = b"h" + NEWLINE
-SWITCH_READ_COMMAND = b"s" + NEWLINE
-BATTERY_READ_COMMAND = b"b" + NEWLINE
-MOTOR_ACTION_STOP_COMMAND = b"x" + NEWLINE
-LED_COMMAND = b"l%i" + NEWLINE
-READ_SENSORS_COMMAND = b"S" + NEWLINE
-PINMODE_COMMAND = b"P%i=%s" + NEWLINE
-DIGITAL_WRITE_COMMAND = b"D%i=%i" + NEWLINE
-DIGITAL_READ_COMMAND = b"D%i" + NEWLINE
+# These are written out in full (with the \n NEWLINE) so they are ready-made 
+# bytes constants, rather than being joined together when the module loads.
+RESET_STATE_COMMAND = b"^\n"
+SHOW_VERSION_COMMAND = b"v\n"
+VERBOSE_OFF_COMMAND = b"V0\n"
+VERBOSE_ON_COMMAND = b"V1\n"
+ECHO_OFF_COMMAND = b"E0\n"
+ECHO_ON_COMMAND = b"E1\n"
+OK_COMMAND = b"?\n"
+HELP_COMMAND = b"h\n"
+SWITCH_READ_COMMAND = b"s\n"
+BATTERY_READ_COMMAND = b"b\n"
+MOTOR_ACTION_STOP_COMMAND = b"x\n"
+LED_COMMAND = b"l%i\n"
+READ_SENSORS_COMMAND = b"S\n"
+PINMODE_COMMAND = b"P%i=%s\n"
+DIGITAL_WRITE_COMMAND = b"D%i=%i\n"
+DIGITAL_READ_COMMAND = b"D%i\n"
 
 CONTROL_C_ETX = b"\x03"      # aborts line
 CONTROL_X_CAN = b"\x18"      # aborts line and resets interpreter
 
+# Sent in one write at the start of reset_arduino(). If the interpreter is 
+# still resetting and misses the RESET_STATE_COMMAND we send it again.
+_RESET_PREAMBLE = CONTROL_C_ETX + CONTROL_X_CAN + RESET_STATE_COMMAND
+
 ################################################################
 # 
 # List of Responses
 # 
 
 UNSOLICITED_PREFIX = b"@"
+UNSOLICITED_PREFIX_BYTE = 0x40      # b"@"[0] - indexing bytes gives an int
 ERROR_PREFIX = b"@Error:"
 RESET_STATE_RETURN = b"RST"
 OK_RESULT_VERBOSE = b"OK"
 OK_RESULT_NUMERIC = ERROR_PREFIX + b"0"
 
+# for checking prefixes with a slice, e.g. data[:_ERROR_PREFIX_LEN] == ERROR_PREFIX
+_ERROR_PREFIX_LEN = len(ERROR_PREFIX)
+_RESET_STATE_RETURN_LEN = len(RESET_STATE_RETURN)
+
 
 ################################################################
 # 
@@ -154,6 +159,167 @@ class MajorError(Exception):
 class SerialSyncError(Exception):
     pass
 
+################################################################
+# 
+# Buffered Serial Port
+# 
+
+class BufferedSerial(serial.Serial):
+    """ A serial port with a read-ahead buffer.
+
+    pyserial's read_until() issues a read(1) for every byte, which is a lot of 
+    system calls per reply on a Pi Zero. Instead we read whatever the port has 
+    waiting in one go (up to about 1/6 second of data at the baud rate) and 
+    hand out read() and read_until() results from the buffer.
+    Timeouts work the same as serial.Serial, from the port timeout.
+
+    Where the port has a file descriptor (Linux, Mac) we wait for data with 
+    select() and read it with os.read(), so we wake up as soon as data arrives 
+    and skip pyserial's per-call overhead. Elsewhere (Windows) we fall back to 
+    serial.Serial.read(). Writes always go through pyserial. cancel_read() 
+    still works, so a read blocked in another thread can be woken up.
+    """
+    def __init__(self, *args, **kwargs):
+        self._buf = bytearray()
+        self._fd = None
+        super().__init__(*args, **kwargs)
+        self._buf_size = max(256, self.baudrate // 64)
+
+    def open(self):
+        super().open()
+        try:
+            self._fd = self.fileno()
+        except (OSError, serial.SerialException):
+            self._fd = None
+
+    def close(self):
+        # anything read ahead belongs to this connection, not the next open()
+        self._fd = None
+        self._buf.clear()
+        super().close()
+
+    def reset_input_buffer(self):
+        # pyserial only flushes the kernel queue, so drop our read-ahead too
+        self._buf.clear()
+        super().reset_input_buffer()
+
+    @property
+    def in_waiting(self):
+        return len(self._buf) + super().in_waiting
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+    @staticmethod
+    def _expired(deadline):
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _fill(self, deadline):
+        """ Add whatever the port has waiting (at least one byte) to the buffer.
+        :return False if nothing arrived before the deadline
+        """
+        if self._fd is None:
+            waiting = super().in_waiting
+            if waiting:
+                # already here, so this read won't wait
+                data = super().read(min(self._buf_size, waiting))
+            elif deadline is None:
+                data = super().read(1)
+            else:
+                # wait only for what's left of the timeout, not a fresh one
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                old_timeout = self.timeout
+                self.timeout = remaining
+                try:
+                    data = super().read(1)
+                finally:
+                    self.timeout = old_timeout
+            self._buf.extend(data)
+            return len(data) != 0
+
+        # pyserial's cancel_read() writes to this pipe to wake up a blocked read
+        abort_fd = getattr(self, "pipe_abort_read_r", None)
+        fds = [self._fd] if abort_fd is None else [self._fd, abort_fd]
+        while True:
+            # sleep in the kernel until data arrives
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            ready = select.select(fds, [], [], timeout)[0]
+            if not ready:
+                return False
+            if abort_fd is not None and abort_fd in ready:
+                os.read(abort_fd, 1000)
+                return False
+            try:
+                data = os.read(self._fd, self._buf_size)
+            except (BlockingIOError, InterruptedError):
+                continue
+            if not data:
+                # same as pyserial - readable but no data means the device went away
+                raise serial.SerialException(
+                    "device reports readiness to read but returned no data")
+            self._buf.extend(data)
+            return True
+
+    def _take(self, n):
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def read(self, size=1):
+        deadline = self._deadline()
+        filled = False
+        while len(self._buf) < size:
+            # like pyserial, give up once the timeout is used up even if data 
+            # is still trickling in
+            if (filled and self._expired(deadline)) or not self._fill(deadline):
+                break
+            filled = True
+        return self._take(size)
+
+    def read_until(self, expected=NEWLINE, size=None):
+        deadline = self._deadline()
+        start = 0
+        filled = False
+        while True:
+            i = self._buf.find(expected, start)
+            if i >= 0:
+                end = i + len(expected)
+                break
+            if size is not None and len(self._buf) >= size:
+                end = size
+                break
+            # the expected bytes might be split across reads
+            start = max(0, len(self._buf) - len(expected) + 1)
+            if (filled and self._expired(deadline)) or not self._fill(deadline):
+                # timeout
+                end = len(self._buf)
+                break
+            filled = True
+        if size is not None:
+            end = min(end, size)
+        return self._take(end)
+
+################################################################
+# 
+# Robot State
+# 
+
+class RobotState:
+    """ What we know about the Arduino Nano's interpreter settings.
+    One of these is attached to each port by set_up_port() as port._robot.
+    """
+    __slots__ = ("echo_on", "numeric_error_codes", "ok_result")
+
+    def __init__(self):
+        self.echo_on = True
+        self.numeric_error_codes = False
+        # reply to OK_COMMAND, changes with set_numeric_error_codes()
+        self.ok_result = OK_RESULT_VERBOSE
+
 ################################################################
 # 
 # General Commad Helper Functions
@@ -163,73 +329,96 @@ def do_command(port, command):
     pass
 
 def process_error_code(data):
-    print(data)
+    log.error("interpreter error: %s", data)
     raise SerialSyncError("Interpreter Error code returned")
 
 def process_unsolicited_data(data):
     """ This function handles any unsolicited data returns that are made.
     These always start with an @ character
     """
-    if data.startswith(ERROR_PREFIX):
+    if data[:_ERROR_PREFIX_LEN] == ERROR_PREFIX:
         process_error_code(data)
     else:
         # TODO: Process unsolicited data
-        print("Unsolicited data unhandled", data)
+        log.debug("unsolicited: %s", data)
 
 
+def _line_iter(port):
+    """ Generator that yields lines (including the NEWLINE) from the port.
+    All the reply handlers read their lines through here. The chunked reading 
+    itself is done by BufferedSerial.read_until().
+    On a timeout whatever partial data we have is yielded without the NEWLINE.
+    """
+    while True:
+        yield port.read_until(NEWLINE)
+
 def blocking_process_reply(port, expected):
     """ This is a generic reply handler, that handles the most common cases of 
-    a single expected return"""
+    a single expected return.
+    Either returns True or raises SerialSyncError."""
     #print("Expecting", expected)
-    while True:
-        data = port.read_until(expected=NEWLINE)
+    for data in _line_iter(port):
         #print('blocking_process_reply:', data)
         if data[-1:] == NEWLINE:
             if data.startswith(expected):
                 return True
             # check for "@Defaulting Params" type commands
-            elif data[0] == UNSOLICITED_PREFIX:
+            elif data[0] == UNSOLICITED_PREFIX_BYTE:
                 process_unsolicited_data(data)
             else:
                 # TODO: Probably need to handle errors here?
-                print(data)
+                log.error("unexpected reply: %s", data)
                 raise SerialSyncError("Unexpected return data")
         else:
             # TODO: Get a better method than throwing an exception.
             raise SerialSyncError("Newline not found - timeout")
-    
-    return False
 
 def blocking_get_reply(port):
     """ This is a generic reply handler, that handles the most common cases of 
-    getting some result back"""
+    getting some result back.
+    Either returns the reply line or raises SerialSyncError."""
 
-    while True:
-        data = port.read_until(expected=NEWLINE)
+    for data in _line_iter(port):
         #print('blocking_get_reply:', data)
         if data[-1:] == NEWLINE:
             # check for "@Defaulting Params" type commands
-            if data[0] == UNSOLICITED_PREFIX:
+            if data[0] == UNSOLICITED_PREFIX_BYTE:
                 process_unsolicited_data(data)
             else:
                 return data # includes the NEWLINE
         else:
             # TODO: Get a better method than throwing an exception.
             raise SerialSyncError("Newline not found - timeout")
-    
-    return False
 
 
 def clear_replies(port):
     """ This is a reply handler that ignores replies up to a timeout happens with no newline"""
-    while True:
-        data = port.read_until(expected=NEWLINE)
+    for data in _line_iter(port):
         #print("clear_replies", data)
         if NEWLINE in data:
-            if data[0] == b"@":
+            if data[0] == UNSOLICITED_PREFIX_BYTE:
                 process_unsolicited_data(data)
         else:
             break
+
+def pipeline_commands(port, commands):
+    """ Send several commands in one write, then collect their replies in order.
+    The interpreter queues up the commands, so we only wait for one round trip
+    rather than one per command.
+
+    :param commands: list of (command, expected). If expected is None the reply
+                     line is returned, like blocking_get_reply(). Otherwise the 
+                     reply must start with expected, like blocking_process_reply().
+    :return: list of replies, one per command
+    """
+    port.write(b"".join(command for command, _ in commands))
+    replies = []
+    for _, expected in commands:
+        if expected is None:
+            replies.append(blocking_get_reply(port))
+        else:
+            replies.append(blocking_process_reply(port, expected))
+    return replies
     
     
 ################################################################
@@ -258,15 +447,17 @@ def clear_replies(port):
 def do_ok_test(port):
     """ do_ok_test is a very basic command that always get a reply. Used for connection testing"""
     port.write(OK_COMMAND)
-    if(numeric_error_codes):
-        blocking_process_reply(port, OK_RESULT_NUMERIC)
-    else:
-        blocking_process_reply(port, OK_RESULT_VERBOSE)
+    blocking_process_reply(port, port._robot.ok_result)
 
 def get_version(port):
     """ get_version is a very basic command that gets the version. Used for getting the version"""
     port.write(SHOW_VERSION_COMMAND)
-    reply = blocking_get_reply(port).rstrip()
+    return parse_version(blocking_get_reply(port))
+
+def parse_version(reply):
+    """ Turn the reply to SHOW_VERSION_COMMAND into a version number, checking 
+    it's new enough"""
+    reply = reply.rstrip()
     if len(reply) < 2 or reply[:1] != b'v':
         print("Version returned =", reply)
         raise MajorError("Version return not correct")
@@ -283,8 +474,7 @@ def set_echo_off(port):
     """
     port.write(ECHO_OFF_COMMAND)
     clear_replies(port)
-    global echo_on
-    echo_on = False
+    port._robot.echo_on = False
 
 def set_echo_on(port):
     """ Send an echo on. 
@@ -292,20 +482,21 @@ def set_echo_on(port):
     """
     port.write(ECHO_ON_COMMAND)
     clear_replies(port)
-    global echo_on
-    echo_on = True
+    port._robot.echo_on = True
 
 def set_numeric_error_codes(port):
     port.write(VERBOSE_OFF_COMMAND) 
     # No reply expected
-    global numeric_error_codes
-    numeric_error_codes = True
+    state = port._robot
+    state.numeric_error_codes = True
+    state.ok_result = OK_RESULT_NUMERIC
 
 def set_text_error_codes(port):
     port.write(VERBOSE_ON_COMMAND) 
     # No reply expected
-    global numeric_error_codes
-    numeric_error_codes = False
+    state = port._robot
+    state.numeric_error_codes = False
+    state.ok_result = OK_RESULT_VERBOSE
 
 def get_switches(port):
     """ get_switches """
@@ -404,39 +595,63 @@ def reset_arduino(port):
     :param port: serial port, as opened by main
     :return: Nothing returned
     """ 
-    port.write(CONTROL_C_ETX)
-    time.sleep(0.02)    # wait 20ms
-    port.write(CONTROL_X_CAN)
-    time.sleep(0.02)
+    port.write(_RESET_PREAMBLE)
+    port.flush()
+    time.sleep(0.04)    # let the Arduino finish its own reset
 
     found = False
     count = 50
-    while not found:
-        port.write(RESET_STATE_COMMAND)
-        time.sleep(0.20)
-        # we do simple processing here
-        lines = port.readlines()
-            #print(lines)
-        for line in lines:
-            if line.startswith(RESET_STATE_RETURN):
-                print("Reset arduino")
-                found = True
+    partial = b""
+    while True:
+        # poll whatever has arrived in one read, rather than read_until()'s
+        # byte at a time, until we see the reset reply or run out of time
+        deadline = time.monotonic() + 0.2
+        while not found and time.monotonic() < deadline:
+            time.sleep(0.02)
+            n = port.in_waiting
+            blob = port.read(n) if n else b""
+            lines = (partial + blob).split(NEWLINE)
+            partial = lines.pop()   # not finished yet, keep for next time
+            for line in lines:
+                if line[:_RESET_STATE_RETURN_LEN] == RESET_STATE_RETURN:
+                    print("Reset arduino")
+                    found = True
+                    break
+        if found:
+            break
         count -= 1;
         if(count <= 0):
             print("Having problems resetting arduino")
             count = 200
+        port.write(RESET_STATE_COMMAND)
 
     clear_replies(port)
     set_echo_off(port)
     # make sure echo is off! (Doing it twice just in case)
     set_echo_off(port)
-    do_ok_test(port)
-    version = get_version(port)
+    # No reply to this, so switch first and test the numeric OK reply below
+    set_numeric_error_codes(port)
+
+    # test things are working ok and get the version, in one go
+    replies = pipeline_commands(port, [(OK_COMMAND, port._robot.ok_result),
+                                       (SHOW_VERSION_COMMAND, None)])
+    version = parse_version(replies[1])
     print("Arduino Nano Software Version = ", version)
-    
-    set_numeric_error_codes(port)    
-    # final tests that things are working ok
-    do_ok_test(port)
+
+async def reset_arduino_async(port):
+    """
+    reset_arduino_async() is reset_arduino() for callers running an asyncio 
+    event loop (e.g. a GUI). The blocking reset runs in a worker thread, so 
+    the event loop keeps running while we wait for the Arduino Nano.
+
+    :param port: serial port, as opened by main
+    :return: Nothing returned
+    """ 
+    # imported here as asyncio is slow to import on a Pi Zero, and main() 
+    # doesn't need it
+    import asyncio
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, reset_arduino, port)
 
 def set_up_port():
     """
@@ -446,7 +661,8 @@ def set_up_port():
     :param port: serial port, as opened by main
     :return: Nothing returned
     """ 
-    port = serial.Serial(serial_port, baudrate = 115200, timeout = 0.1)
+    port = BufferedSerial(serial_port, baudrate = 115200, timeout = REPLY_TIMEOUT)
+    port._robot = RobotState()
     time.sleep(0.05)
     bytes_waiting = port.in_waiting
     if bytes_waiting != 0:
@@ -508,39 +724,65 @@ def wait_for_button_press(port):
 # 
 # Main Program
 # 
+
+def set_up_logging():
+    """
+    Send log messages through a queue, so the (possibly slow) console 
+    writes happen on a background thread rather than in the middle of 
+    reading replies from the serial port.
+    This sets up the root logger, so it's for main() - a GUI or other 
+    program using this module should configure logging itself.
+
+    :return: the QueueListener, stop() it when finished. None if a 
+             QueueHandler is already set up.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return None
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG)
+    listener.start()
+    return listener
     
 def main():
     """ Main function """
-    port = set_up_port()
-    reset_arduino(port)
+    listener = set_up_logging()
+    try:
+        port = set_up_port()
+        reset_arduino(port)
 
-    configure_GPIO_pinmode(port, 6, "OUTPUT")
-    configure_GPIO_pinmode(port, 11, "OUTPUT")
+        configure_GPIO_pinmode(port, 6, "OUTPUT")
+        configure_GPIO_pinmode(port, 11, "OUTPUT")
     
-    bat_voltage = get_battery_voltage(port)
-    print("Battery Voltage", bat_voltage, "volts")
-    if bat_voltage < BATTERY_VOLTAGE_TO_SHUTDOWN:
-        print("WARNING: Low Voltage")
-        # TODO: We should shutdown!
+        bat_voltage = get_battery_voltage(port)
+        print("Battery Voltage", bat_voltage, "volts")
+        if bat_voltage < BATTERY_VOLTAGE_TO_SHUTDOWN:
+            print("WARNING: Low Voltage")
+            # TODO: We should shutdown!
     
-    switch_state = wait_for_button_press(port)
+        switch_state = wait_for_button_press(port)
 
-    print("Switches selected as", "{0:04b}".format(switch_state))
+        print("Switches selected as", "{0:04b}".format(switch_state))
 
-    bat_voltage = get_battery_voltage(port)
-    print("Battery Voltage", bat_voltage, "volts")
-    if bat_voltage < BATTERY_VOLTAGE_TO_SHUTDOWN:
-        print("WARNING: Low Voltage")
-        # TODO: We should shutdown!
+        bat_voltage = get_battery_voltage(port)
+        print("Battery Voltage", bat_voltage, "volts")
+        if bat_voltage < BATTERY_VOLTAGE_TO_SHUTDOWN:
+            print("WARNING: Low Voltage")
+            # TODO: We should shutdown!
 
     
-    # Loop where do we something ... in this case read the sensors and output 
-    # them on the LED
-    while get_switches(port) != 16:
-        time.sleep(0.01)
-        get_sensors(port)
-
-    print("Completed")
+        # Loop where do we something ... in this case read the sensors and output 
+        # them on the LED
+        while get_switches(port) != 16:
+            time.sleep(0.01)
+            get_sensors(port)
+
+        print("Completed")
+    finally:
+        if listener is not None:
+            listener.stop()
 
 if __name__ == "__main__":
     main()
@@ -7,21 +7,20 @@
 #
 # This is licensed under the MIT License. Please see LICENSE.
 
-import os
+from functools import lru_cache
 
 RPI_file = "/sys/firmware/devicetree/base/model"
 
+@lru_cache(maxsize=1)
 def is_raspberry_pi():
 	"""
 	Checks a specific file to see this is likely to be a Raspberry Pi.
 	Assumes you've checked Linux with sys.platform.
+	The result is cached, so only the first call reads the file.
 	:return: True is file looks like a Raspberry Pi
 	""" 
-	if os.path.isfile(RPI_file):
-		f = open(RPI_file, "r")
-		data = f.read()
-		f.close()
-		if data.find("Raspberry") != -1:
-			return True
-	return False
-
+	try:
+		with open(RPI_file, "rb") as f:
+			return b"Raspberry" in f.read()
+	except OSError:
+		return False